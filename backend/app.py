@@ -1,124 +1,415 @@
-from flask import Flask, request, jsonify, send_from_directory
+import os
+
+# Let the fast tokenizer encode batches on multiple threads (and silence its fork warning);
+# must be set before transformers is imported
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
 import fitz  # PyMuPDF
-from transformers import pipeline
-import os
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, BitsAndBytesConfig
+import queue
 import tempfile
 import re
-import base64
+import io
 import json
-import uuid
 import time
 import logging
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice
 from datetime import datetime
 
+from cachetools import TTLCache
+
+from extraction import extract_page_range
+
+try:
+    from blake3 import blake3 as content_hasher  # optional, faster content hashing
+except ImportError:
+    from hashlib import blake2b as content_hasher
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('document_summarizer')
 
-# Configure upload folder
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+# Uploads are read into memory and opened by PyMuPDF directly, never written to disk
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'docx'}
 
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+# Content-Disposition is exposed so the frontend can read export filenames
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True, expose_headers=['Content-Disposition'])
+
+# Number of chunks encoded and generated together per generate call
+INFERENCE_BATCH_SIZE = 8
+
+# Run inference on the GPU when one is available
+DEVICE = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-# Initialize model cache
+# On CPU, let PyTorch use every core unless told otherwise (e.g. when running several workers)
+if DEVICE.type == "cpu":
+    torch.set_num_threads(int(os.environ.get('SUMMARIZER_TORCH_THREADS', os.cpu_count() or 1)))
+
+# Optional bitsandbytes weight quantization ("8bit" or "4bit"), only applied on CUDA
+QUANTIZATION = os.environ.get('SUMMARIZER_QUANTIZATION', '').strip().lower()
+
+# PDFs with at least this many pages are extracted across a process pool
+PARALLEL_EXTRACTION_MIN_PAGES = 8
+EXTRACTION_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Items a background pipeline stage may run ahead of its consumer
+PIPELINE_BUFFER_SIZE = 16
+
+# Longest unfinished sentence carried between pages before it is cut at a word break
+MAX_PENDING_CHARS = 10000
+
+# Longest input (in tokens, including the prompt) passed to the model
+MAX_INPUT_TOKENS = 512
+
+# Finished summaries are cached by content hash so repeated documents skip inference
+SUMMARY_CACHE_SIZE = 256
+SUMMARY_CACHE_TTL = 3600  # seconds
+SUMMARY_FAILED_PREFIX = "Summary generation failed for this section"
+
+# Text patterns, compiled once and shared by every request
+_SENT_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_SENT_PUNCT_RE = re.compile(r'[.!?]+')
+_WORD_RE = re.compile(r'\b[a-zA-Z]{3,}\b')
+_BULLET_RE = re.compile(r'•\s*(.*?)(?=•|\Z)', re.DOTALL)
+
+# Optional model compilation: "torch" (torch.compile) or "onnx" (ONNX Runtime via Optimum)
+MODEL_BACKEND = os.environ.get('SUMMARIZER_COMPILE', '').strip().lower()
+
+# Initialize model cache; each server process loads its own models lazily on first use
 model_cache = {}
+model_cache_lock = threading.Lock()
+
+# TTLCache is not thread-safe, so access goes through summary_cache_lock
+summary_cache = TTLCache(maxsize=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL)
+summary_cache_lock = threading.Lock()
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_model_dtype():
+    """
+    Pick the weight dtype for inference.
+    Half precision on CUDA (bf16 where supported), full precision on CPU.
+    """
+    if DEVICE.type == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return torch.float32
+
+def get_quantization_config():
+    """
+    Build the bitsandbytes config selected by SUMMARIZER_QUANTIZATION.
+    Returns None when quantization is disabled or no GPU is available.
+    """
+    if DEVICE.type != "cuda" or QUANTIZATION in ('', 'none'):
+        return None
+    if QUANTIZATION == '8bit':
+        return BitsAndBytesConfig(load_in_8bit=True)
+    if QUANTIZATION == '4bit':
+        return BitsAndBytesConfig(load_in_4bit=True, bnb_4bit_compute_dtype=get_model_dtype())
+    logger.warning(f"Unknown SUMMARIZER_QUANTIZATION value '{QUANTIZATION}', loading unquantized model")
+    return None
+
+def load_onnx_model(model_name):
+    """
+    Export the model to ONNX and load it with ONNX Runtime, with all graph optimizations enabled.
+    """
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    provider = "CUDAExecutionProvider" if DEVICE.type == "cuda" else "CPUExecutionProvider"
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        model_name,
+        export=True,
+        provider=provider,
+        session_options=session_options
+    )
+
 def get_model(model_name="MBZUAI/lamini-flan-t5-248m"):
     """
-    Load and cache the summarization model.
+    Load and cache the tokenizer and summarization model.
+    Returns a (tokenizer, model) tuple.
     """
-    if model_name not in model_cache:
+    if model_name in model_cache:
+        return model_cache[model_name]
+    
+    # Threaded workers may request the same model concurrently; load it only once
+    with model_cache_lock:
+        if model_name in model_cache:
+            return model_cache[model_name]
+        
         logger.info(f"Loading model: {model_name}")
-        model_cache[model_name] = pipeline("text2text-generation", model=model_name)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Batched inputs are padded to a common length, so the tokenizer needs a pad token
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        # ONNX Runtime runs its own graph, so bitsandbytes quantization does not apply to it
+        quantization_config = get_quantization_config() if MODEL_BACKEND != 'onnx' else None
+        if MODEL_BACKEND == 'onnx':
+            model = load_onnx_model(model_name)
+        elif quantization_config is not None:
+            # Quantized weights are placed by accelerate and cannot be moved with .to();
+            # torch.compile is skipped for them as bitsandbytes kernels do not compile
+            model = AutoModelForSeq2SeqLM.from_pretrained(
+                model_name,
+                quantization_config=quantization_config,
+                device_map="auto"
+            )
+        else:
+            # Load straight into the target dtype instead of materialising FP32 weights first
+            model = AutoModelForSeq2SeqLM.from_pretrained(model_name, torch_dtype=get_model_dtype())
+            model.to(DEVICE)
+            model.eval()
+            if MODEL_BACKEND == 'torch':
+                # A static KV cache keeps tensor shapes fixed between decoding steps, so the
+                # compiled forward pass (and its CUDA graphs) is not recompiled as the cache grows
+                static_cache = getattr(model, '_can_compile_fullgraph', False) or \
+                    getattr(model, '_supports_static_cache', False)
+                if static_cache:
+                    model.generation_config.cache_implementation = "static"
+                # Fuse the forward pass; CUDA graphs cut per-token launch overhead on GPU
+                mode = "reduce-overhead" if DEVICE.type == "cuda" and static_cache else "default"
+                model.forward = torch.compile(model.forward, mode=mode, fullgraph=False)
+        logger.info(f"Model {model_name} loaded on {model.device} "
+                    f"(quantization: {QUANTIZATION if quantization_config else 'none'}, "
+                    f"compile: {MODEL_BACKEND or 'none'})")
+        model_cache[model_name] = (tokenizer, model)
     return model_cache[model_name]
 
-def extract_text_from_pdf(file_path):
+# Extraction process pool, started on first use and shared by every request of this process
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def get_extraction_pool():
     """
-    Extracts all text from a PDF file using PyMuPDF.
-    Returns text, page count, and table of contents.
+    Returns this process's extraction pool, starting it on first use. Workers are
+    started with forkserver (or spawn) rather than forked from a threaded server.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            _extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=context)
+        return _extraction_pool
+
+def discard_extraction_pool(pool):
+    """
+    Drops a broken extraction pool so the next request starts a fresh one.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def read_pdf_outline(data, filetype="pdf"):
+    """
+    Returns the page count and table of contents of an in-memory document without extracting its text.
+    """
+    with fitz.open(stream=data, filetype=filetype) as doc:
+        return len(doc), doc.get_toc()
+
+def extract_text_pages(data, filetype="pdf"):
+    """
+    Yields the text of each page of an in-memory document in page order using PyMuPDF.
+    Large documents are split into page ranges extracted in parallel processes.
     """
-    text = ""
-    page_count = 0
-    toc = []
-    
     try:
-        with fitz.open(file_path) as doc:
+        with fitz.open(stream=data, filetype=filetype) as doc:
             page_count = len(doc)
-            toc = doc.get_toc()
             
-            for page in doc:
-                text += page.get_text()
+            if page_count < PARALLEL_EXTRACTION_MIN_PAGES or EXTRACTION_WORKERS < 2:
+                for page in doc:
+                    yield page.get_text()
+                return
         
-        return text, page_count, toc
+        # One contiguous page range per worker, yielded back in page order
+        step = -(-page_count // EXTRACTION_WORKERS)
+        starts = list(range(0, page_count, step))
+        stops = [min(start + step, page_count) for start in starts]
+        pool = get_extraction_pool()
+        futures = [pool.submit(extract_page_range, data, filetype, start, stop)
+                   for start, stop in zip(starts, stops)]
+        try:
+            for future in futures:
+                yield from future.result()
+        except BrokenProcessPool:
+            discard_extraction_pool(pool)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {str(e)}")
         raise
 
-def analyze_text(text):
+class TextAnalyzer:
     """
-    Analyze the extracted text to get basic metrics.
+    Accumulates basic text metrics incrementally, so a document can be
+    analyzed sentence by sentence without holding its full text.
     """
-    word_count = len(text.split())
-    char_count = len(text)
-    sentences = re.split(r'[.!?]+', text)
-    sentence_count = len([s for s in sentences if s.strip()])
     
-    avg_words_per_sentence = round(word_count / max(1, sentence_count), 1)
+    def __init__(self, preview_length=500):
+        self.word_count = 0
+        self.char_count = 0
+        self.sentence_count = 0
+        self.word_freq = Counter()
+        self.preview = ""
+        self.preview_length = preview_length
     
-    # Word frequency analysis (top 20)
-    words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
-    word_freq = {}
-    for word in words:
-        if word in word_freq:
-            word_freq[word] += 1
-        else:
-            word_freq[word] = 1
+    def add_text(self, text):
+        """
+        Record a raw piece of text (e.g. a page) for the character count and preview.
+        """
+        self.char_count += len(text)
+        if len(self.preview) <= self.preview_length:
+            self.preview += text[:self.preview_length + 1 - len(self.preview)]
     
-    # Sort by frequency and get top 20
-    word_freq = dict(sorted(word_freq.items(), key=lambda item: item[1], reverse=True)[:20])
+    def add_sentence(self, sentence):
+        """
+        Add the word and sentence metrics of one sentence.
+        """
+        self.word_count += len(sentence.split())
+        segments = _SENT_PUNCT_RE.split(sentence)
+        self.sentence_count += sum(1 for s in segments if s.strip())
+        self.word_freq.update(_WORD_RE.findall(sentence.lower()))
     
-    return {
-        "word_count": word_count,
-        "char_count": char_count,
-        "sentence_count": sentence_count,
-        "avg_words_per_sentence": avg_words_per_sentence,
-        "word_freq": word_freq
-    }
+    def results(self):
+        """
+        Returns the metrics for all text seen so far.
+        """
+        avg_words_per_sentence = round(self.word_count / max(1, self.sentence_count), 1)
+        
+        # Top 20 words by frequency
+        word_freq = dict(self.word_freq.most_common(20))
+        
+        return {
+            "word_count": self.word_count,
+            "char_count": self.char_count,
+            "sentence_count": self.sentence_count,
+            "avg_words_per_sentence": avg_words_per_sentence,
+            "word_freq": word_freq
+        }
 
-def chunk_text(text, max_tokens=700):
+def scan_and_chunk(pages, tokenizer, analyzer, max_tokens=480):
     """
-    Splits the text into smaller chunks for large document summarization.
+    Makes a single pass over a stream of text (e.g. PDF pages): splits it into
+    sentences, feeds each sentence to the analyzer and packs it into chunks of
+    at most max_tokens model tokens for large document summarization.
+    Chunks are yielded as lists of token ids as soon as they are full, so the
+    summarizer can feed them to the model without tokenizing them again.
+    The analyzer is complete once the generator is exhausted.
     """
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current_chunk = ""
+    split = _SENT_SPLIT.split
+    encode = tokenizer.encode
+    pending = ""
+    current_ids = []
+    
+    def pack(sentence):
+        nonlocal current_ids
+        analyzer.add_sentence(sentence)
+        # Whitespace-only pieces carry no text for the model
+        if not sentence.strip():
+            return
+        # Byte-level BPE (e.g. BART) keeps spaces in its tokens, so a sentence
+        # continuing a chunk is encoded with the space that separated it
+        sentence_ids = encode(" " + sentence if current_ids else sentence, add_special_tokens=False)
+        if current_ids and len(current_ids) + len(sentence_ids) > max_tokens:
+            yield current_ids
+            current_ids = []
+            sentence_ids = encode(sentence, add_special_tokens=False)
+        
+        # A single sentence longer than the budget is split across chunks
+        if len(sentence_ids) > max_tokens:
+            tail_start = (len(sentence_ids) - 1) // max_tokens * max_tokens
+            for start in range(0, tail_start, max_tokens):
+                yield sentence_ids[start:start + max_tokens]
+            sentence_ids = sentence_ids[tail_start:]
+        current_ids.extend(sentence_ids)
+    
+    for page_text in pages:
+        analyzer.add_text(page_text)
+        sentences = split(pending + page_text)
+        # The last piece may continue on the next page, so a sentence running
+        # across a page break is kept whole
+        pending = sentences.pop()
+        for sentence in sentences:
+            yield from pack(sentence)
+        
+        # Text without sentence punctuation (tables, lists, code) would otherwise
+        # carry the whole document forward; flush it up to the last word break
+        if len(pending) > MAX_PENDING_CHARS:
+            if pending[-1].isspace():
+                head, pending = pending, ""
+            else:
+                pieces = pending.rsplit(None, 1)
+                head, pending = (pieces[0], pieces[1]) if len(pieces) == 2 else (pending, "")
+            yield from pack(head)
+    
+    if pending:
+        yield from pack(pending)
+    
+    if current_ids:
+        yield current_ids
 
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) <= max_tokens:
-            current_chunk += sentence + " "
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence + " "
+def run_in_background(iterable, max_buffered=PIPELINE_BUFFER_SIZE):
+    """
+    Consumes an iterable on a background thread and yields its items, so a
+    producer stage (e.g. extraction) runs ahead while the consumer (e.g.
+    inference) is busy. Exceptions from the producer are re-raised here.
+    """
+    buffer = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event()
     
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    def put(item):
+        # Give up once the consumer has gone away instead of blocking forever
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
     
-    return chunks
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+        except Exception as e:
+            put((False, e))
+            return
+        put((False, None))
+    
+    executor = ThreadPoolExecutor(max_workers=1)
+    executor.submit(produce)
+    try:
+        while True:
+            ok, value = buffer.get()
+            if ok:
+                yield value
+            elif value is None:
+                return
+            else:
+                raise value
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True)
 
 def get_prompt_prefix(style):
     """
@@ -134,61 +425,107 @@ def get_prompt_prefix(style):
     
     return styles.get(style, style)  # Return the style itself if custom or not found
 
-def summarize_long_text(text, model, style="Concise", max_tokens=700, min_length=100, max_length=350):
+def get_special_token_ids(tokenizer):
     """
-    Handles long text summarization using chunking.
+    Returns the (leading, trailing) special token ids the tokenizer wraps around
+    an input, found by encoding a probe text with and without special tokens.
+    Works with both slow and fast tokenizers across transformers versions.
+    """
+    plain = tokenizer.encode("x", add_special_tokens=False)
+    wrapped = tokenizer.encode("x")
+    for start in range(len(wrapped) - len(plain) + 1):
+        if wrapped[start:start + len(plain)] == plain:
+            return wrapped[:start], wrapped[start + len(plain):]
+    return [], []
+
+def get_chunk_budget(tokenizer, style, max_tokens):
+    """
+    Returns the chunk size in tokens that fits the model input together with
+    the style's prompt prefix and the model's special tokens.
+    """
+    prefix_ids = tokenizer.encode(get_prompt_prefix(style), add_special_tokens=False)
+    leading_ids, trailing_ids = get_special_token_ids(tokenizer)
+    special_count = len(leading_ids) + len(trailing_ids)
+    budget = min(max_tokens, MAX_INPUT_TOKENS - special_count - len(prefix_ids))
+    if budget < 1:
+        raise SummaryRequestError('The summary style prompt is too long for the model input')
+    return budget
+
+def iter_summaries(chunks, tokenizer, model, style="Concise", min_length=100, max_length=350):
     """
-    chunks = chunk_text(text, max_tokens)
-    summaries = []
-    prompt_prefix = get_prompt_prefix(style)
+    Summarizes a stream of tokenized chunks from scan_and_chunk, yielding each
+    chunk's summary as soon as its batch is generated.
+    Chunks are generated in mini-batches of INFERENCE_BATCH_SIZE as they
+    arrive from the chunker.
+    """
+    prefix_ids = tokenizer.encode(get_prompt_prefix(style), add_special_tokens=False)
+    leading_ids, trailing_ids = get_special_token_ids(tokenizer)
+    # Chunks are sized by get_chunk_budget; the cut only guards against oversized callers
+    max_body_length = MAX_INPUT_TOKENS - len(leading_ids) - len(trailing_ids)
+    chunks = iter(chunks)
+    start = 0
     
-    for i, chunk in enumerate(chunks):
-        logger.info(f"Summarizing chunk {i+1}/{len(chunks)}")
-        # Add prompt prefix to the chunk
-        input_text = prompt_prefix + chunk
+    while True:
+        chunk_batch = list(islice(chunks, INFERENCE_BATCH_SIZE))
+        if not chunk_batch:
+            break
+        logger.info(f"Summarizing chunks {start+1}-{start+len(chunk_batch)}")
         
-        # Generate summary
+        # Generate summaries for the whole batch in a single generate call
         try:
-            result = model(
-                input_text, 
-                max_length=max_length, 
-                min_length=min_length, 
-                truncation=True, 
-                do_sample=False
-            )[0]['generated_text']
-            
-            summaries.append(result)
+            batch = [
+                leading_ids + (prefix_ids + chunk_ids)[:max_body_length] + trailing_ids
+                for chunk_ids in chunk_batch
+            ]
+            encoded = tokenizer.pad(
+                {"input_ids": batch},
+                padding=True,
+                return_tensors="pt"
+            ).to(model.device)
+            # No autograd bookkeeping is needed for inference
+            with torch.inference_mode():
+                output = model.generate(
+                    **encoded,
+                    max_new_tokens=max_length,
+                    min_length=min_length,
+                    num_beams=1,
+                    do_sample=False
+                )
+            summaries = tokenizer.batch_decode(output, skip_special_tokens=True)
         except Exception as e:
-            logger.error(f"Error generating summary for chunk {i+1}: {str(e)}")
-            summaries.append(f"Summary generation failed for this section: {str(e)}")
-    
-    return summaries
+            logger.error(f"Error generating summary for chunks {start+1}-{start+len(chunk_batch)}: {str(e)}")
+            summaries = [f"{SUMMARY_FAILED_PREFIX}: {str(e)}"] * len(chunk_batch)
+        
+        yield from summaries
+        start += len(chunk_batch)
+
+def summarize_long_text(chunks, tokenizer, model, style="Concise", min_length=100, max_length=350):
+    """
+    Summarizes a stream of tokenized chunks and returns the list of summaries.
+    """
+    return list(iter_summaries(chunks, tokenizer, model, style, min_length, max_length))
 
 def get_combined_summary(summaries, style="Concise"):
     """
     Combines multiple summary parts into a single cohesive summary
     """
     if style == "Bullet Points":
+        find_bullets = _BULLET_RE.findall
+        split_sentence = _SENT_SPLIT.split
         combined = []
         for part in summaries:
             # Extract bullet points if they exist
-            bullets = re.findall(r'•\s*(.*?)(?=•|\Z)', part, re.DOTALL)
+            bullets = find_bullets(part)
             if not bullets:
                 # If no bullet format detected, create bullets from sentences
-                sentences = re.split(r'(?<=[.!?])\s+', part)
+                sentences = split_sentence(part)
                 bullets = [s.strip() for s in sentences if s.strip()]
             combined.extend(bullets)
         
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_bullets = []
-        for bullet in combined:
-            cleaned = bullet.strip()
-            if cleaned and cleaned not in seen:
-                seen.add(cleaned)
-                unique_bullets.append(f"• {cleaned}")
+        # Remove duplicates while preserving order (dict keys keep insertion order)
+        unique_bullets = dict.fromkeys(cleaned for cleaned in map(str.strip, combined) if cleaned)
         
-        return "\n".join(unique_bullets)
+        return "\n".join(f"• {bullet}" for bullet in unique_bullets)
     else:
         # For other styles, just join with paragraph breaks
         return "\n\n".join(summaries)
@@ -203,90 +540,227 @@ def home():
 def serve_static(path):
     return send_from_directory('public', path)
 
-# POST route to process PDF
-@app.route('/process-pdf', methods=['POST'])
-def process_pdf():
+def summary_cache_key(kind, content, model_name, style, max_tokens, min_length, max_length, filetype=""):
+    """
+    Hashes document content (text or raw file bytes) together with every setting
+    that affects its summary, including the file type it is parsed as.
+    """
+    hasher = content_hasher(f"{kind}|{filetype}|{model_name}|{style}|{max_tokens}|{min_length}|{max_length}|".encode())
+    hasher.update(content if isinstance(content, bytes) else content.encode())
+    return hasher.hexdigest()
+
+def get_cached_summary(key):
+    """
+    Returns the cached result for a summary_cache_key, or None.
+    """
+    with summary_cache_lock:
+        return summary_cache.get(key)
+
+def cache_summary(key, result):
+    """
+    Caches a finished result unless some part of it failed to generate.
+    """
+    if any(part.startswith(SUMMARY_FAILED_PREFIX) for part in result['summary_parts']):
+        return
+    with summary_cache_lock:
+        summary_cache[key] = result
+
+class SummaryRequestError(ValueError):
+    """
+    Raised for input that cannot be summarized; reported to the client as a 400.
+    """
+
+class EmptyDocumentError(SummaryRequestError):
+    """
+    Raised when no text could be extracted from an uploaded document.
+    """
+
+def parse_int_param(params, name, default, minimum=1):
+    """
+    Reads an integer request parameter, raising SummaryRequestError if it is
+    not an integer of at least minimum.
+    """
+    value = params.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise SummaryRequestError(f"'{name}' must be an integer")
+    if value < minimum:
+        raise SummaryRequestError(f"'{name}' must be at least {minimum}")
+    return value
+
+def process_document(data, filetype, filename, model_name="MBZUAI/lamini-flan-t5-248m", style="Concise",
+                     max_tokens=480, min_length=100, max_length=350):
+    """
+    Extracts, analyzes and summarizes an uploaded document held in memory.
+    Yields (event, data) pairs: 'meta' with the document structure, one 'part'
+    per chunk summary as it is generated, and 'done' with the full result.
+    """
     start_time = time.time()
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part in request'}), 400
-    
-    file = request.files['file']
-    
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-    
-    if not allowed_file(file.filename):
-        return jsonify({'error': f'File type not supported. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400
+    chunks = None
+    cache_key = summary_cache_key('document', data, model_name, style, max_tokens, min_length, max_length,
+                                  filetype=filetype)
     
-    # Get parameters from the request
-    model_name = request.form.get('model', 'MBZUAI/lamini-flan-t5-248m')
-    summary_style = request.form.get('style', 'Concise')
-    max_token_length = int(request.form.get('max_tokens', 700))
-    min_summary_length = int(request.form.get('min_length', 100))
-    max_summary_length = int(request.form.get('max_length', 350))
+    cached = get_cached_summary(cache_key)
+    if cached is not None:
+        logger.info(f"Serving cached summary for {filename}")
+        yield 'meta', {'filename': filename, 'page_count': cached['page_count'], 'toc': cached['toc']}
+        for i, summary in enumerate(cached['summary_parts']):
+            yield 'part', {'part': i, 'text': summary}
+        yield 'done', dict(
+            cached,
+            filename=filename,
+            processing_time=round(time.time() - start_time, 2),
+            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+        return
     
     try:
-        # Generate unique filename to avoid collisions
-        unique_filename = str(uuid.uuid4()) + "_" + file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+        # Step 1: Read document structure; page text is streamed below
+        page_count, toc = read_pdf_outline(data, filetype)
+        yield 'meta', {'filename': filename, 'page_count': page_count, 'toc': toc}
         
-        # Save uploaded file
-        file.save(file_path)
-        logger.info(f"File saved: {file_path}")
+        # Step 2: Analyze and chunk the pages in one pass as they stream from the extractor
+        analyzer = TextAnalyzer()
         
-        # Step 1: Extract text from PDF
-        pdf_text, page_count, toc = extract_text_from_pdf(file_path)
+        # Chunks are sized in model tokens, so the tokenizer is needed up front
+        tokenizer, model = get_model(model_name)
+        chunk_budget = get_chunk_budget(tokenizer, style, max_tokens)
         
-        if not pdf_text.strip():
-            os.remove(file_path)
-            return jsonify({'error': 'No text could be extracted from the document'}), 400
+        # Extraction and analysis/chunking each run on their own thread, ahead of
+        # inference on this one, so their CPU work overlaps with generation
+        pages = run_in_background(extract_text_pages(data, filetype))
+        chunks = run_in_background(scan_and_chunk(pages, tokenizer, analyzer, chunk_budget))
         
-        # Step 2: Analyze text
-        analysis_results = analyze_text(pdf_text)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            raise EmptyDocumentError('No text could be extracted from the document')
         
-        # Step 3: Generate summary
-        model = get_model(model_name)
-        summary_parts = summarize_long_text(
-            pdf_text,
+        # Step 3: Generate summary, emitting each part as soon as it is ready
+        summary_parts = []
+        for i, summary in enumerate(iter_summaries(
+            chain([first_chunk], chunks),
+            tokenizer,
             model,
-            summary_style,
-            max_tokens=max_token_length,
-            min_length=min_summary_length,
-            max_length=max_summary_length
-        )
+            style,
+            min_length=min_length,
+            max_length=max_length
+        )):
+            summary_parts.append(summary)
+            yield 'part', {'part': i, 'text': summary}
+        analysis_results = analyzer.results()
         
         # Get combined summary as well
-        combined_summary = get_combined_summary(summary_parts, summary_style)
+        combined_summary = get_combined_summary(summary_parts, style)
         
         # Calculate processing time
         processing_time = round(time.time() - start_time, 2)
         
-        # Return the results
-        response = {
-            'filename': file.filename,
+        result = {
+            'filename': filename,
             'page_count': page_count,
             'toc': toc,
-            'text_preview': pdf_text[:500] + "..." if len(pdf_text) > 500 else pdf_text,
+            'text_preview': analyzer.preview[:500] + "..." if len(analyzer.preview) > 500 else analyzer.preview,
             'analysis': analysis_results,
             'summary_parts': summary_parts,
             'combined_summary': combined_summary,
             'processing_time': processing_time,
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        
-        # Store the file_path in a session or database if you want to keep it
-        # For this example, we'll clean up the file:
-        os.remove(file_path)
+        cache_summary(cache_key, result)
+        yield 'done', result
+    finally:
+        # Stop the background stages if we are closed early
+        if chunks is not None:
+            chunks.close()
+
+def format_sse(data, event=None):
+    """
+    Formats a JSON payload as a Server-Sent Events message.
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def read_pdf_upload():
+    """
+    Validates and reads the uploaded document of a process-pdf request.
+    Returns (job, None) with the process_document arguments on success,
+    or (None, error_response) if the request is invalid.
+    """
+    if 'file' not in request.files:
+        return None, (jsonify({'error': 'No file part in request'}), 400)
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return None, (jsonify({'error': 'No selected file'}), 400)
+    
+    if not allowed_file(file.filename):
+        return None, (jsonify({'error': f'File type not supported. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400)
+    
+    # Get parameters from the request
+    try:
+        job = {
+            'filetype': file.filename.rsplit('.', 1)[1].lower(),
+            'filename': file.filename,
+            'model_name': request.form.get('model', 'MBZUAI/lamini-flan-t5-248m'),
+            'style': request.form.get('style', 'Concise'),
+            'max_tokens': parse_int_param(request.form, 'max_tokens', 480),
+            'min_length': parse_int_param(request.form, 'min_length', 100, minimum=0),
+            'max_length': parse_int_param(request.form, 'max_length', 350)
+        }
+    except SummaryRequestError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    
+    # Keep the upload in memory; PyMuPDF opens it straight from the bytes
+    job['data'] = file.read()
+    logger.info(f"File received: {file.filename} ({len(job['data'])} bytes)")
+    
+    return job, None
+
+# POST route to process PDF, streaming summary parts as Server-Sent Events
+@app.route('/process-pdf', methods=['POST'])
+def process_pdf():
+    job, error_response = read_pdf_upload()
+    if error_response:
+        return error_response
+    
+    def generate():
+        try:
+            for event, data in process_document(**job):
+                # Summary parts go out as plain messages, everything else as named events
+                yield format_sse(data, None if event == 'part' else event)
+        except SummaryRequestError as e:
+            yield format_sse({'error': str(e)}, 'error')
+        except Exception as e:
+            logger.error(f"Error processing document: {str(e)}")
+            yield format_sse({'error': f"Processing failed: {str(e)}"}, 'error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# POST route to process PDF and return the whole result in one JSON response
+@app.route('/process-pdf-sync', methods=['POST'])
+def process_pdf_sync():
+    job, error_response = read_pdf_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        response = None
+        for event, data in process_document(**job):
+            if event == 'done':
+                response = data
         
         return jsonify(response)
         
+    except SummaryRequestError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}")
-        # Clean up if there was an error
-        try:
-            os.remove(file_path)
-        except:
-            pass
         return jsonify({'error': f"Processing failed: {str(e)}"}), 500
 
 # POST route to summarize text only
@@ -304,19 +778,35 @@ def summarize():
     # Get parameters from the request
     model_name = data.get('model', 'MBZUAI/lamini-flan-t5-248m')
     summary_style = data.get('style', 'Concise')
-    max_token_length = data.get('max_tokens', 700)
-    min_summary_length = data.get('min_length', 100)
-    max_summary_length = data.get('max_length', 350)
+    try:
+        max_token_length = parse_int_param(data, 'max_tokens', 480)
+        min_summary_length = parse_int_param(data, 'min_length', 100, minimum=0)
+        max_summary_length = parse_int_param(data, 'max_length', 350)
+    except SummaryRequestError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         start_time = time.time()
         
-        model = get_model(model_name)
+        cache_key = summary_cache_key('text', text, model_name, summary_style,
+                                      max_token_length, min_summary_length, max_summary_length)
+        cached = get_cached_summary(cache_key)
+        if cached is not None:
+            return jsonify(dict(
+                cached,
+                processing_time=round(time.time() - start_time, 2),
+                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            ))
+        
+        # The text is analyzed in the same pass that chunks it
+        analyzer = TextAnalyzer()
+        tokenizer, model = get_model(model_name)
+        chunk_budget = get_chunk_budget(tokenizer, summary_style, max_token_length)
         summary_parts = summarize_long_text(
-            text,
+            run_in_background(scan_and_chunk([text], tokenizer, analyzer, chunk_budget)),
+            tokenizer,
             model,
             summary_style,
-            max_tokens=max_token_length,
             min_length=min_summary_length,
             max_length=max_summary_length
         )
@@ -324,19 +814,23 @@ def summarize():
         # Get combined summary
         combined_summary = get_combined_summary(summary_parts, summary_style)
         
-        # Analyze text as well for completeness
-        analysis_results = analyze_text(text)
+        analysis_results = analyzer.results()
         
         processing_time = round(time.time() - start_time, 2)
         
-        return jsonify({
+        result = {
             'analysis': analysis_results,
             'summary_parts': summary_parts,
             'combined_summary': combined_summary,
             'processing_time': processing_time,
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
+        }
+        cache_summary(cache_key, result)
+        
+        return jsonify(result)
         
+    except SummaryRequestError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Summarization failed: {str(e)}")
         return jsonify({'error': f"Summarization failed: {str(e)}"}), 500
@@ -367,10 +861,7 @@ def export_summary():
                 for i, part in enumerate(summary_parts):
                     content += f"--- Part {i+1} ---\n{part}\n\n"
             
-            response = {
-                'content': base64.b64encode(content.encode()).decode(),
-                'filename': f"{os.path.splitext(filename)[0]}_summary.txt"
-            }
+            extension, mimetype = 'txt', 'text/plain'
             
         elif export_format == 'markdown':
             content = f"# Summary of {filename}\n\n"
@@ -386,10 +877,7 @@ def export_summary():
                 for i, part in enumerate(summary_parts):
                     content += f"### Part {i+1}\n\n{part}\n\n"
             
-            response = {
-                'content': base64.b64encode(content.encode()).decode(),
-                'filename': f"{os.path.splitext(filename)[0]}_summary.md"
-            }
+            extension, mimetype = 'md', 'text/markdown'
             
         elif export_format == 'json':
             export_data = {
@@ -407,17 +895,19 @@ def export_summary():
                 "combined_summary": combined_summary
             }
             
-            json_str = json.dumps(export_data, indent=2)
-            
-            response = {
-                'content': base64.b64encode(json_str.encode()).decode(),
-                'filename': f"{os.path.splitext(filename)[0]}_summary.json"
-            }
+            content = json.dumps(export_data, indent=2)
+            extension, mimetype = 'json', 'application/json'
             
         else:
             return jsonify({'error': 'Unsupported export format'}), 400
         
-        return jsonify(response)
+        # Send the file itself rather than base64 inside JSON
+        return send_file(
+            io.BytesIO(content.encode('utf-8')),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"{os.path.splitext(filename)[0]}_summary.{extension}"
+        )
         
     except Exception as e:
         logger.error(f"Export failed: {str(e)}")
@@ -0,0 +1,14 @@
+"""
+Page text extraction run in the extraction worker processes. Kept apart from
+app.py so the workers only import PyMuPDF, not torch and transformers.
+"""
+import fitz  # PyMuPDF
+
+
+def extract_page_range(data, filetype, start, stop):
+    """
+    Extracts the text of pages [start, stop) of an in-memory document.
+    """
+    fitz.TOOLS.mupdf_warnings(reset=True)
+    with fitz.open(stream=data, filetype=filetype) as doc:
+        return [doc[page_number].get_text() for page_number in range(start, stop)]
@@ -0,0 +1,23 @@
+# Gunicorn settings for the Document Summarizer API.
+# Run from the backend directory: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.environ.get('SUMMARIZER_BIND', '0.0.0.0:5050')
+workers = int(os.environ.get('SUMMARIZER_WORKERS', 4))
+worker_class = 'gthread'
+threads = int(os.environ.get('SUMMARIZER_THREADS', 4))
+# Summarizing a large document can take several minutes
+timeout = 600
+
+# Import the app in each worker after fork, so every worker initializes CUDA
+# and builds its own model cache on first request instead of sharing the master's
+preload_app = False
+
+def post_fork(server, worker):
+    # Share the CPU cores between workers instead of each worker's PyTorch using all of them
+    os.environ.setdefault('SUMMARIZER_TORCH_THREADS', str(max(1, (os.cpu_count() or 1) // server.cfg.workers)))
+    
+    # With SUMMARIZER_GPUS=N, pin each worker to a single GPU, round-robin
+    gpus = int(os.environ.get('SUMMARIZER_GPUS', 0))
+    if gpus:
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(worker.age % gpus)
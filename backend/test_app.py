@@ -0,0 +1,172 @@
+import io
+
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast
+
+import app
+
+
+class CharTokenizer:
+    """One token per character, including whitespace."""
+
+    def encode(self, text, add_special_tokens=True):
+        ids = [ord(c) for c in text]
+        return ids + [1] if add_special_tokens else ids
+
+    def num_special_tokens_to_add(self):
+        return 1
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word."""
+
+    def encode(self, text, add_special_tokens=True):
+        return text.split()
+
+
+def byte_level_tokenizer():
+    """A real fast tokenizer built offline, wrapped like BART: <s> ... </s>."""
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.train_from_iterator(
+        ["Hello there. World is big. " + app.get_prompt_prefix("Concise")],
+        trainers.BpeTrainer(
+            vocab_size=300,
+            special_tokens=["<pad>", "<s>", "</s>"],
+            initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+        )
+    )
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 1), ("</s>", 2)]
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="<pad>", bos_token="<s>", eos_token="</s>"
+    )
+
+
+class EchoModel:
+    """Stands in for a seq2seq model; 'generates' its own input ids."""
+
+    device = torch.device("cpu")
+
+    def __init__(self):
+        self.inputs = []
+
+    def generate(self, input_ids, attention_mask, **kwargs):
+        self.inputs.append(input_ids)
+        return input_ids
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def chunk(pages, max_tokens, tokenizer=None):
+    tokenizer = tokenizer or CharTokenizer()
+    return list(app.scan_and_chunk(pages, tokenizer, app.TextAnalyzer(), max_tokens))
+
+
+@pytest.mark.parametrize("max_tokens", [0, -3, "abc", None])
+def test_summarize_rejects_invalid_max_tokens(client, max_tokens):
+    response = client.post('/summarize', json={'text': 'Hello world.', 'max_tokens': max_tokens})
+    assert response.status_code == 400
+
+
+def test_process_pdf_rejects_zero_max_tokens(client):
+    response = client.post(
+        '/process-pdf-sync',
+        data={'file': (io.BytesIO(b'%PDF'), 'doc.pdf'), 'max_tokens': '0'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 400
+
+
+def test_chunk_budget_leaves_room_for_prompt():
+    prefix = app.get_prompt_prefix("Concise")
+    budget = app.get_chunk_budget(CharTokenizer(), "Concise", 700)
+    assert budget == app.MAX_INPUT_TOKENS - 1 - len(prefix)
+    assert app.get_chunk_budget(CharTokenizer(), "Concise", 50) == 50
+
+
+def test_chunk_budget_rejects_oversized_prompt():
+    with pytest.raises(app.SummaryRequestError):
+        app.get_chunk_budget(CharTokenizer(), "x" * app.MAX_INPUT_TOKENS, 480)
+
+
+def test_long_sentence_is_split_to_budget():
+    chunks = chunk(["a" * 25], 10)
+    assert [len(c) for c in chunks] == [10, 10, 5]
+
+
+def test_whitespace_only_text_yields_no_chunks():
+    assert chunk(["   \n", "\t  "], 10) == []
+
+
+def test_long_sentence_split_exactly_at_budget():
+    assert [len(c) for c in chunk(["a" * 20], 10)] == [10, 10]
+
+
+def test_unpunctuated_pages_are_chunked_with_bounded_carry():
+    class RecordingTokenizer(WordTokenizer):
+        longest = 0
+
+        def encode(self, text, add_special_tokens=True):
+            self.longest = max(self.longest, len(text))
+            return super().encode(text, add_special_tokens)
+
+    # ~3.7 KB pages with no sentence boundary, like tables or code listings
+    page = "cell value " * 336 + "\n"
+    pages = [page] * 2000
+    tokenizer = RecordingTokenizer()
+    analyzer = app.TextAnalyzer()
+
+    chunks = list(app.scan_and_chunk(pages, tokenizer, analyzer, 480))
+
+    # The carried text is flushed instead of growing with the document, so
+    # scanning stays linear in its length
+    assert tokenizer.longest <= app.MAX_PENDING_CHARS + len(page) + 1
+    assert sum(len(c) for c in chunks) == 2 * 336 * len(pages)
+    assert all(len(c) <= 480 for c in chunks)
+    # Flushing at word breaks must not split or merge words
+    assert analyzer.word_count == 2 * 336 * len(pages)
+    assert analyzer.results()["word_freq"] == {"cell": 336 * len(pages), "value": 336 * len(pages)}
+
+
+def test_cache_key_depends_on_filetype():
+    args = ('document', b'same bytes', 'model', 'Concise', 480, 100, 350)
+    assert app.summary_cache_key(*args, filetype='pdf') != app.summary_cache_key(*args, filetype='txt')
+
+
+def test_iter_summaries_with_real_tokenizer():
+    tokenizer = byte_level_tokenizer()
+    model = EchoModel()
+    chunks = app.scan_and_chunk(["Hello there. World is big."], tokenizer, app.TextAnalyzer(), 100)
+
+    summaries = list(app.iter_summaries(chunks, tokenizer, model))
+
+    assert len(summaries) == 1
+    assert summaries[0].startswith(app.get_prompt_prefix("Concise"))
+    assert summaries[0].endswith("Hello there. World is big.")
+    # Inputs are wrapped in the tokenizer's own special tokens
+    input_ids = model.inputs[0][0].tolist()
+    assert input_ids[0] == tokenizer.bos_token_id and input_ids[-1] == tokenizer.eos_token_id
+
+
+def test_iter_summaries_marks_failed_batch():
+    class BrokenModel(EchoModel):
+        def generate(self, input_ids, attention_mask, **kwargs):
+            raise RuntimeError("out of memory")
+
+    tokenizer = byte_level_tokenizer()
+    summaries = list(app.iter_summaries([[5, 6], [7]], tokenizer, BrokenModel()))
+    assert all(s.startswith(app.SUMMARY_FAILED_PREFIX) for s in summaries) and len(summaries) == 2
+
+
+def test_chunks_keep_spaces_between_sentences():
+    tokenizer = byte_level_tokenizer()
+    chunks = chunk(["Hello there. World", " is big. Bye."], 100, tokenizer)
+    assert [tokenizer.decode(ids) for ids in chunks] == ["Hello there. World is big. Bye."]
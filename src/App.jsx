@@ -47,7 +47,7 @@ function App() {
       formData.append('file', selectedFile);
       formData.append('style', selectedStyle);
 
-      // Process PDF in one API call
+      // Process PDF; summary parts are streamed back as Server-Sent Events
       const response = await fetch('http://localhost:5050/process-pdf', {
         method: 'POST',
         body: formData,
@@ -59,13 +59,10 @@ function App() {
       }
 
       setProgress({ status: 'Analyzing document...', current: 1, total: 3 });
-      
-      // Since our backend now processes everything in one go, we just need to wait for the response
-      setTimeout(() => {
-        setProgress({ status: 'Generating summary...', current: 2, total: 3 });
-      }, 1000);
 
-      const result = await response.json();
+      const result = await readSummaryStream(response, (part) => {
+        setProgress({ status: `Generating summary (part ${part + 1})...`, current: 2, total: 3 });
+      });
       
       setSummary({
         filename: selectedFile.name,
@@ -85,6 +82,41 @@ function App() {
     }
   };
 
+  // Reads the /process-pdf event stream and resolves with the final result
+  const readSummaryStream = async (response, onPart) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Messages are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const message = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let event = 'message';
+        let data = '';
+        message.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (!data) continue;
+
+        const payload = JSON.parse(data);
+        if (event === 'error') throw new Error(payload.error || 'Failed to process PDF');
+        if (event === 'done') return payload;
+        if (event === 'message') onPart(payload.part);
+      }
+    }
+
+    throw new Error('Connection closed before the summary was complete');
+  };
+
   const handleReset = () => {
     setFile(null);
     setSummary(null);
@@ -119,16 +151,15 @@ function App() {
         throw new Error('Failed to export summary');
       }
 
-      const result = await response.json();
-      
-      // Create blob from base64 content
-      const content = atob(result.content);
-      const blob = new Blob([content], { type: getContentType(format) });
+      // The export comes back as the file itself; take its name from Content-Disposition
+      const blob = await response.blob();
+      const disposition = response.headers.get('Content-Disposition') || '';
+      const filenameMatch = disposition.match(/filename="?([^";]+)"?/);
       
       // Create download link
       const downloadLink = document.createElement('a');
       downloadLink.href = URL.createObjectURL(blob);
-      downloadLink.download = result.filename;
+      downloadLink.download = filenameMatch ? filenameMatch[1] : `summary.${getFileExtension(format)}`;
       document.body.appendChild(downloadLink);
       downloadLink.click();
       document.body.removeChild(downloadLink);
@@ -139,14 +170,14 @@ function App() {
     }
   };
 
-  const getContentType = (format) => {
+  const getFileExtension = (format) => {
     switch (format) {
       case 'markdown':
-        return 'text/markdown';
+        return 'md';
       case 'json':
-        return 'application/json';
+        return 'json';
       default:
-        return 'text/plain';
+        return 'txt';
     }
   };
 